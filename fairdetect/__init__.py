@@ -1,20 +1,93 @@
-import matplotlib.pyplot as plt
+from functools import lru_cache
 from random import randrange
+from types import SimpleNamespace
+import warnings
 import numpy as np
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
 import pandas as pd
 from scipy.stats import chi2_contingency
-import fairlearn.metrics as met
-import sklearn.metrics as msl
-from tabulate import tabulate
 from scipy.stats import chisquare
-from sklearn.metrics import precision_score
 
 __version__ = '0.5'
 
 # Hello
 
+# Plotting and metric libraries (matplotlib, plotly, shap, fairlearn, sklearn,
+# tabulate, numba) are imported inside the methods that need them.
+
+# Counts are taken with np.bincount. Setting USE_NUMBA = True switches to a
+# parallel numba kernel instead; it is compiled once per process (seconds), while
+# a warm call saves well under a millisecond per million rows, so it is off
+# by default.
+USE_NUMBA = False
+
+
+@lru_cache(maxsize=None)
+def _bincount_kernel():
+    """
+    Returns the parallel numba counting kernel, or None if numba is not installed.
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    @njit(parallel=True)
+    def kernel(code, n_bins, n_chunks):
+        size = (len(code) + n_chunks - 1) // n_chunks
+        out = np.zeros((n_chunks, n_bins), np.int64)
+        for c in prange(n_chunks):
+            for i in range(c*size, min((c+1)*size, len(code))):
+                out[c, code[i]] += 1
+        return out.sum(0)
+
+    return kernel
+
+
+def _predictive_binary(y_true, y_pred, groups, n_groups):
+    """
+    Computes the precision of each group for 0/1 targets and predictions.
+
+    Groups without positive predictions get a precision of 0, as
+    precision_score does.
+    """
+    positive = y_pred == 1
+    tp = np.bincount(groups[positive], weights=y_true[positive], minlength=n_groups)
+    predicted = np.bincount(groups[positive], minlength=n_groups)
+    return np.divide(tp, predicted, out=np.zeros(n_groups), where=predicted > 0)
+
+
+def _count_codes(code, n_bins):
+    """
+    Counts the occurrences of each integer code in [0, n_bins).
+
+    Uses np.bincount, or the parallel numba kernel when USE_NUMBA is set and
+    numba is installed.
+    """
+    if USE_NUMBA:
+        kernel = _bincount_kernel()
+        if kernel is not None:
+            return kernel(np.ascontiguousarray(code, dtype=np.int64), n_bins, 64)
+    return np.bincount(code, minlength=n_bins)
+
+
+def _confusion_rates(counts):
+    """
+    Derives the ability metrics from per-group confusion counts.
+
+    counts is an array of shape (groups, 4) holding TN, FP, FN, TP per row.
+    """
+    tn, fp, fn, tp = counts.T.astype(float)
+    pos, neg = tp+fn, tn+fp
+
+    def ratio(num, den):
+        return np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+    return {"true_positive_rate_m": ratio(tp, pos),
+            "false_positive_rate_m": ratio(fp, neg),
+            "true_negative_rate_m": ratio(tn, neg),
+            "false_negative_rate_m": ratio(fn, pos),
+            "selection_rate": ratio(tp+fp, pos+neg),
+            "accuracy_score": ratio(tp+tn, pos+neg)}
 
 class FairDetect:
     def __init__(self,model,X_test,y_test):
@@ -33,8 +106,26 @@ class FairDetect:
         y_test (DataFrame) :
             DataFrame given for test target variable.
         """
+        if X_test.dtypes.nunique() == 1 and X_test.dtypes.iloc[0].kind in 'biuf':
+            # Store homogeneous numeric frames column-major so column reductions are stride-1
+            values = X_test.values
+            if not values.flags.f_contiguous:
+                X_test = pd.DataFrame(np.asfortranarray(values), index=X_test.index, columns=X_test.columns)
         self.model,self.X_test,self.y_test = model, X_test, y_test
-    
+        self._pred_cache = None
+        self._explainer = None
+
+    def _predict(self):
+        """
+        Returns the model predictions for X_test, computing them only once.
+
+        The cache holds the frame the predictions were made on, so they are only
+        reused while self.X_test is still that same object; reassigning X_test
+        triggers a fresh inference pass.
+        """
+        if self._pred_cache is None or self._pred_cache[0] is not self.X_test:
+            self._pred_cache = (self.X_test, self.model.predict(self.X_test))
+        return self._pred_cache[1]
 
     def create_labels(self,X_test,sensitive):
         """
@@ -64,7 +155,7 @@ class FairDetect:
         return(sensitive_label)
 
 
-    def representation(self,X_test,y_test,sensitive,labels,predictions):
+    def representation(self,X_test,y_test,sensitive,labels,predictions,prefer_fancy=False):
 
         """
         Compares the representation of the sensitive variable and its
@@ -90,6 +181,9 @@ class FairDetect:
         predictions :
             Predictions of the target variable previously computed for all the
             records.
+        prefer_fancy (bool) :
+            If True, cont_table is drawn as a tabulate 'fancy_grid' table instead
+            of the plain DataFrame text layout.
 
         Returns
         -------
@@ -99,6 +193,8 @@ class FairDetect:
         sens_df (dict) :
             Dictionary which stores separate tables for each of the values of the
             labels of the sensitive feature, and relates them with the target.
+            Each table holds the sensitive column, the predictions ('p') and the
+            target ('t').
         fig :
             Two histograms with frequencies of the sensitive and the target variables
         p :
@@ -106,40 +202,54 @@ class FairDetect:
             indicating level of relation between target and sensitive variables.
         """
 
-        full_table = X_test.copy()
-        sens_df = {}
-
-        for i in labels:
-            full_table['p'] = predictions
-            full_table['t'] = y_test
-            sens_df[labels[i]] = full_table[full_table[sensitive]==i]
+        from plotly.subplots import make_subplots
+        import plotly.graph_objects as go
+
+        full_table = pd.DataFrame({sensitive: X_test[sensitive], 'p': predictions}, index=X_test.index)
+        full_table['t'] = y_test
+
+        groups = dict(list(full_table.groupby(sensitive, sort=False)))
+        sens_df = {labels[i]: groups[i] for i in labels}
+
+        # Like pd.crosstab, drop rows missing either value before taking the categories,
+        # so a group whose targets are all missing gets no (all-zero) row.
+        valid = (full_table[sensitive].notna() & full_table['t'].notna()).to_numpy()
+        sens_cat = pd.Categorical(full_table[sensitive].to_numpy()[valid])
+        targ_cat = pd.Categorical(full_table['t'].to_numpy()[valid])
+        # Counted with bincount rather than pd.crosstab or scipy's crosstab, which sorts via np.unique.
+        # Categorical codes are int8 for up to 127 categories; only the combined key is widened
+        n_sens, n_targ = len(sens_cat.categories), len(targ_cat.categories)
+        contigency_p = _count_codes(sens_cat.codes.astype(np.int64)*n_targ + targ_cat.codes,
+                                    n_sens*n_targ).reshape(n_sens, n_targ)
+        c, p, dof, expected = chi2_contingency(contigency_p)
+        contigency_pct_p = pd.DataFrame(contigency_p / contigency_p.sum(1, keepdims=True),
+                                        index=pd.Index(sens_cat.categories, name=sensitive),
+                                        columns=pd.Index(targ_cat.categories, name='t'))
 
-        contigency_p = pd.crosstab(full_table[sensitive], full_table['t']) 
-        cp, pp, dofp, expectedp = chi2_contingency(contigency_p) 
-        contigency_pct_p = pd.crosstab(full_table[sensitive], full_table['t'], normalize='index')
+        sens_counts = X_test[sensitive].value_counts(normalize=True)
+        labl_counts = y_test.value_counts(normalize=True)
 
-        sens_rep = {}
-        labl_rep = {}
-        for i in labels:
-            sens_rep[labels[i]] = (X_test[sensitive].value_counts()/X_test[sensitive].value_counts().sum())[i]
-            labl_rep[str(i)] = (y_test.value_counts()/y_test.value_counts().sum())[i]
+        sens_rep = {labels[i]: sens_counts[i] for i in labels}
+        labl_rep = {str(i): labl_counts[i] for i in labels}
 
         fig = make_subplots(rows=1, cols=2)
 
-        for i in labels:
-            fig.add_trace(go.Bar(
-                showlegend=False,
-                x=[labels[i]],
-                y=[sens_rep[labels[i]]]), row=1, col=1)
+        fig.add_trace(go.Bar(
+            showlegend=False,
+            x=list(sens_rep.keys()),
+            y=list(sens_rep.values())), row=1, col=1)
 
-            fig.add_trace(go.Bar(
-                showlegend=False,
-                x=[str(i)],
-                y=[labl_rep[str(i)]],
-                marker_color=['orange', 'blue'][i]), row=1, col=2)
+        fig.add_trace(go.Bar(
+            showlegend=False,
+            x=list(labl_rep.keys()),
+            y=list(labl_rep.values()),
+            marker_color=[['orange', 'blue'][i] for i in labels]), row=1, col=2)
 
-        c, p, dof, expected = chi2_contingency(contigency_p)
-        cont_table = (tabulate(contigency_pct_p.T, headers=labels.values(), tablefmt='fancy_grid'))
+        if prefer_fancy:
+            from tabulate import tabulate
+            cont_table = (tabulate(contigency_pct_p.T, headers=labels.values(), tablefmt='fancy_grid'))
+        else:
+            cont_table = contigency_pct_p.T.rename(columns=labels).to_string(float_format=lambda x: f'{x:.3f}')
 
         return cont_table, sens_df, fig, p
 
@@ -187,9 +297,20 @@ class FairDetect:
                 true_positive_rate_m, false_positive_rate_m, true_negative_rate_m, false_negative_rate_m,
                 selection_rate, accuracy_score
 
+            When the target and the predictions only contain 0 and 1, the same
+            by_group and overall attributes are computed directly from the
+            confusion counts by _fast_metric_frame() instead.
 
         """
 
+        # y_test may be a one-column DataFrame; the count path needs flat arrays
+        y_true, y_pred = np.asarray(self.y_test).ravel(), np.asarray(predictions).ravel()
+        if (len(y_true) == len(y_pred) and np.isin(y_true, (0, 1)).all()
+                and np.isin(y_pred, (0, 1)).all()):
+            return self._fast_metric_frame(y_true.astype(np.int8), y_pred.astype(np.int8), sen_feat_test)
+
+        import fairlearn.metrics as met
+        import sklearn.metrics as msl
         metric_frame = met.MetricFrame(metrics={"true_positive_rate_m": met.true_positive_rate,
                                                     "false_positive_rate_m": met.false_positive_rate,
                                                     "true_negative_rate_m": met.true_negative_rate,
@@ -204,6 +325,36 @@ class FairDetect:
 
         return(metric_frame)
 
+    def _fast_metric_frame(self, y_true, y_pred, sen_feat_test):
+
+        """
+        Computes the same disaggregated metrics as ability() for 0/1 targets
+        from a single count of (group, y_true, y_pred) combinations. y_true and
+        y_pred are expected as int8 arrays.
+
+        Returns
+        -------
+        metric_frame (SimpleNamespace):
+            Object exposing by_group and overall with the same metric columns as
+            the Fairlearn MetricFrame, so ability_plots() and ability_metrics()
+            can use it unchanged. Rates with an empty denominator are set to 0.
+        """
+
+        sens_cat = pd.Categorical(sen_feat_test)
+        groups = sens_cat.codes
+        valid = groups >= 0
+        n_groups = len(sens_cat.categories)
+        code = groups[valid].astype(np.int64)*4 + y_true[valid]*2 + y_pred[valid]
+        counts = _count_codes(code, 4*n_groups).reshape(n_groups, 4)
+
+        name = getattr(sen_feat_test, 'name', None)
+        if name is None:
+            name = 'sensitive_feature_0'
+        by_group = pd.DataFrame(_confusion_rates(counts), index=pd.Index(sens_cat.categories, name=name))
+        overall = pd.Series({k: v[0] for k, v in _confusion_rates(counts.sum(0, keepdims=True)).items()})
+
+        return SimpleNamespace(by_group=by_group, overall=overall)
+
 
 
 
@@ -285,23 +436,18 @@ class FairDetect:
             Null Hypothesis is accepted indicating the non-existence of disparities.
 
         """
-        dic_met = metric_frame.by_group.to_dict(orient='list')
-        dic_p_val = {}
         list_test = ['true_positive_rate_m','false_positive_rate_m','true_negative_rate_m','false_negative_rate_m']
-        for key, items in dic_met.items():
-            if key in list_test:
-                p_val =chisquare(list(np.array(list(items))*100))[1]
-                dic_p_val[key]=p_val
+        keys = [key for key in metric_frame.by_group.columns if key in list_test]
+        rates = metric_frame.by_group[keys].to_numpy(dtype=float).T*100
+        p_vals = chisquare(rates, axis=1)[1]
 
-        for key, items in dic_p_val.items():
-            if items <= 0.01:
-                print("With 99% Confidence Level, Reject H0: "+ key +" with p= ", items)
-            elif items <= 0.05:
-                print("With 95% Confidence Level, Reject H0: "+ key +" with p= ", items)
-            elif items <= 0.1:
-                print("With 90% Confidence Level, Reject H0: "+ key +" with p= ", items)
-            else:
-                print("Accept H0: " + key +" Disparity is Not Detected. p= ", items)
+        messages = ("With 99% Confidence Level, Reject H0: {} with p= ",
+                    "With 95% Confidence Level, Reject H0: {} with p= ",
+                    "With 90% Confidence Level, Reject H0: {} with p= ",
+                    "Accept H0: {} Disparity is Not Detected. p= ")
+        levels = np.searchsorted([0.01, 0.05, 0.1], p_vals)
+        for key, level, items in zip(keys, levels, p_vals):
+            print(messages[level].format(key), items)
 
 
 
@@ -342,10 +488,20 @@ class FairDetect:
 
         """
 
-        precision_dic = {}
+        import plotly.graph_objects as go
+
+        frames = [sens_df[labels[i]] for i in labels]
+        y_true = np.concatenate([frame['t'].to_numpy() for frame in frames])
+        y_pred = np.concatenate([frame['p'].to_numpy() for frame in frames])
 
-        for i in labels:
-            precision_dic[labels[i]] = precision_score(sens_df[labels[i]]['t'],sens_df[labels[i]]['p'])
+        if np.isin(y_true, (0, 1)).all() and np.isin(y_pred, (0, 1)).all():
+            groups = np.repeat(np.arange(len(frames)), [len(frame) for frame in frames])
+            precision_dic = dict(zip(labels.values(), _predictive_binary(y_true, y_pred, groups, len(frames))))
+        else:
+            from sklearn.metrics import precision_score
+            precision_dic = {}
+            for i in labels:
+                precision_dic[labels[i]] = precision_score(sens_df[labels[i]]['t'],sens_df[labels[i]]['p'])
 
         fig = go.Figure([go.Bar(x=list(labels.values()), y=list(precision_dic.values()))])
 
@@ -423,7 +579,7 @@ class FairDetect:
             of the target variable.
         """
         
-        predictions = self.model.predict(self.X_test)
+        predictions = self._predict()
         cont_table,sens_df,rep_fig,rep_p = self.representation(self.X_test,self.y_test,sensitive,labels,predictions)
 
         print("REPRESENTATION")
@@ -533,37 +689,41 @@ class FairDetect:
         """
 
         import shap
-        explainer = shap.Explainer(self.model)
-
-        full_table = self.X_test.copy()
-        full_table['t'] = self.y_test
-        full_table['p'] = self.model.predict(self.X_test)
-
-        shap_values = explainer(self.X_test)
-        sens_glob_coh = np.where(self.X_test[sensitive]==list(labels.keys())[0],labels[0],labels[1])
-
-        misclass = full_table[full_table.t != full_table.p]
-        affected_class = misclass[(misclass[sensitive] == affected_group) & (misclass.p == affected_target)]
+        import matplotlib.pyplot as plt
+        import plotly.graph_objects as go
+        if self._explainer is None:
+            self._explainer = shap.Explainer(self.model)
+
+        target = pd.DataFrame(index=self.X_test.index)
+        target['t'] = self.y_test
+
+        shap_values = self._explainer(self.X_test)
+        codes = pd.Categorical(self.X_test[sensitive], categories=list(labels.keys())).codes
+        sens_glob_coh = np.asarray(list(labels.values()))[codes]
+
+        t, p, s = target['t'].to_numpy(), self._predict(), self.X_test[sensitive].to_numpy()
+        aff_mask = (t != p) & (s == affected_group) & (p == affected_target)
+        tru_mask = (t == p) & (s == affected_group) & (t == affected_target)
+        aff_idx = np.flatnonzero(aff_mask)
+        affected_class = self.X_test.iloc[aff_idx]
+        tru_class = self.X_test.iloc[np.flatnonzero(tru_mask)]
+        aff_shap = shap_values[aff_idx]
 
         plt.subplots_adjust(right=1.4,wspace=1)
 
         print("Model Importance Comparison")
         shap.plots.bar(shap_values.cohorts(sens_glob_coh).abs.mean(0),show=False)
         plt.subplot(1, 2, 2) # row 1, col 2 index 1
-        shap_values2 = explainer(affected_class.drop(['t','p'],axis=1))
-        shap.plots.bar(shap_values2)
-
-        full_table['t'] = self.y_test
-        full_table['p'] = self.model.predict(self.X_test)
+        shap.plots.bar(aff_shap)
 
-        misclass = full_table[full_table.t != full_table.p]
-        affected_class = misclass[(misclass[sensitive] == affected_group) & (misclass.p == affected_target)]
-
-        truclass = full_table[full_table.t == full_table.p]
-        tru_class = truclass[(truclass[sensitive] == affected_group) & (truclass.t == affected_target)]
-
-        x_axis = list(affected_class.drop(['t','p',sensitive],axis=1).columns)
-        affect_character = list((affected_class.drop(['t','p',sensitive],axis=1).mean()-tru_class.drop(['t','p',sensitive],axis=1).mean())/affected_class.drop(['t','p',sensitive],axis=1).mean())
+        x_axis = [c for c in self.X_test.columns if c != sensitive]
+        with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+            # Skip missing values like pandas .mean(); empty or all-NaN columns give NaN silently
+            warnings.simplefilter('ignore', RuntimeWarning)
+            aff_mean = np.nanmean(np.asfortranarray(affected_class[x_axis].to_numpy()), axis=0)
+            tru_mean = np.nanmean(np.asfortranarray(tru_class[x_axis].to_numpy()), axis=0)
+            full_mean = np.nanmean(np.asfortranarray(self.X_test[x_axis].to_numpy()), axis=0)
+            affect_character = list((aff_mean-tru_mean)/aff_mean)
 
         fig = go.Figure([go.Bar(x=x_axis, y=affect_character)])
 
@@ -571,19 +731,15 @@ class FairDetect:
         print("Average Comparison to True Class Members")
         fig.show()
 
-        misclass = full_table[full_table.t != full_table.p]
-        affected_class = misclass[(misclass[sensitive] == affected_group) & (misclass.p == affected_target)]
-
-        x_axis = list(affected_class.drop(['t','p',sensitive],axis=1).columns)
-        affect_character = list((affected_class.drop(['t','p',sensitive],axis=1).mean()-full_table.drop(['t','p',sensitive],axis=1).mean())/affected_class.drop(['t','p',sensitive],axis=1).mean())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            affect_character = list((aff_mean-full_mean)/aff_mean)
 
         fig = go.Figure([go.Bar(x=x_axis, y=affect_character)])
         print("Average Comparison to All Members")
         fig.show()
 
         print("Random Affected Decision Process")
-        explainer = shap.Explainer(self.model)
-        shap.plots.waterfall(explainer(affected_class.drop(['t','p'],axis=1))[randrange(0, len(affected_class))],show=False)
+        shap.plots.waterfall(aff_shap[randrange(0, len(affected_class))],show=False)
 
 
 